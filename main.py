@@ -20,10 +20,12 @@ iCloud Drive 文件夹上传工具
 - LOCAL_FOLDER_PATH: 本地文件夹路径
 - REMOTE_FOLDER_NAME: 远程文件夹名称（可选）
 - CONFLICT_MODE: 冲突处理模式（skip/overwrite/ask）
+- VERIFY_UPLOADS: 是否在后台校验已上传文件（true/false，默认 true）
 
 关键技术点：
 - 使用重新连接策略解决 iCloud API 文件夹创建后无法立即访问的问题
 - 备用上传策略：当文件夹创建失败时，使用扁平化命名上传文件
+- 后台校验：每个文件夹上传完成后延迟重新列出，核对文件名和大小，不一致的文件重新上传
 - 支持中国大陆 iCloud 服务
 """
 
@@ -31,11 +33,19 @@ from pyicloud import PyiCloudService
 import os
 import mimetypes
 import time
+import queue
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
 
-def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, conflict_mode='ask'):
+# 上传线程与后台校验线程共用同一个 PyiCloudService 会话。
+# requests.Session 和 pyicloud 的会话/重新认证逻辑都没有承诺线程安全，
+# 因此上传和校验期间的 iCloud API 调用都在此锁内串行执行。
+_api_lock = threading.RLock()
+
+
+def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, conflict_mode='ask', verify=True):
     """
     递归上传整个文件夹到iCloud Drive
     
@@ -44,6 +54,7 @@ def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, con
         local_folder_path: 本地文件夹路径
         remote_folder_name: 远程文件夹名称(可选，默认使用本地文件夹名)
         conflict_mode: 文件冲突处理模式 ('ask', 'overwrite', 'skip')
+        verify: 是否在后台校验已上传的文件（校验不阻塞上传）
     """
     local_path = Path(local_folder_path)
 
@@ -71,11 +82,7 @@ def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, con
             print(f"✓ 成功创建文件夹: {remote_folder_name}")
 
         # 递归上传文件夹内容
-        success_count, error_count = _upload_folder_contents(remote_folder, local_path, "", conflict_mode, api)
-
-        print(f"\n📊 上传统计:")
-        print(f"  ✓ 成功: {success_count} 个文件")
-        print(f"  ✗ 失败: {error_count} 个文件")
+        success_count, error_count = _upload_and_verify(remote_folder, local_path, conflict_mode, api, verify)
 
         # 如果有成功上传的文件，就认为部分成功
         # 如果所有文件都失败，才认为完全失败
@@ -86,11 +93,7 @@ def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, con
             print(f"⚠ 文件夹 '{remote_folder_name}' 已存在，继续上传内容...")
             try:
                 remote_folder = api.drive[remote_folder_name]
-                success_count, error_count = _upload_folder_contents(remote_folder, local_path, "", conflict_mode, api)
-
-                print(f"\n📊 上传统计:")
-                print(f"  ✓ 成功: {success_count} 个文件")
-                print(f"  ✗ 失败: {error_count} 个文件")
+                success_count, error_count = _upload_and_verify(remote_folder, local_path, conflict_mode, api, verify)
 
                 return success_count > 0
             except Exception as e2:
@@ -101,6 +104,33 @@ def upload_folder_to_icloud(api, local_folder_path, remote_folder_name=None, con
             return False
 
 
+def _upload_and_verify(remote_folder, local_path, conflict_mode, api, verify):
+    """上传文件夹内容并（可选）等待后台校验结束，打印统计并返回 (成功数, 失败数)"""
+    verifier = UploadVerifier() if verify else None
+    if verifier:
+        verifier.start()
+
+    success_count, error_count = _upload_folder_contents(remote_folder, local_path, "", conflict_mode, api, verifier)
+
+    verify_failed = 0
+    unverified = 0
+    if verifier:
+        verify_failed, unverified = verifier.finish()
+        # 校验失败的文件此前已计为成功，这里改记为失败
+        success_count -= verify_failed
+        error_count += verify_failed
+
+    print(f"\n📊 上传统计:")
+    print(f"  ✓ 成功: {success_count} 个文件")
+    print(f"  ✗ 失败: {error_count} 个文件")
+    if verifier:
+        print(f"  🔍 校验失败: {verify_failed} 个文件")
+        if unverified:
+            print(f"  ⚠ 未能校验: {unverified} 个文件")
+
+    return success_count, error_count
+
+
 def _create_and_access_folder(parent_folder, folder_name, api=None, parent_path=""):
     """
     创建并访问文件夹的增强函数 - 核心技术实现
@@ -196,10 +226,12 @@ def _create_and_access_folder(parent_folder, folder_name, api=None, parent_path=
     return None
 
 
-def _upload_folder_contents(remote_folder, local_folder_path, relative_path, conflict_mode='ask', api=None):
+def _upload_folder_contents(remote_folder, local_folder_path, relative_path, conflict_mode='ask', api=None, verifier=None):
     """递归上传文件夹内容"""
     success_count = 0
     error_count = 0
+    # 本文件夹中实际上传的文件，文件夹处理完成后统一交给后台校验
+    uploaded_files = [] if verifier else None
 
     try:
         items = list(local_folder_path.iterdir())
@@ -210,7 +242,9 @@ def _upload_folder_contents(remote_folder, local_folder_path, relative_path, con
 
             if item.is_file():
                 # 上传文件
-                if _upload_single_file(remote_folder, item, item_relative_path, conflict_mode):
+                with _api_lock:
+                    uploaded = _upload_single_file(remote_folder, item, item_relative_path, conflict_mode, uploaded_files)
+                if uploaded:
                     success_count += 1
                 else:
                     error_count += 1
@@ -220,43 +254,44 @@ def _upload_folder_contents(remote_folder, local_folder_path, relative_path, con
                 sub_remote_folder = None
                 folder_created = False
                 
-                # 首先检查文件夹是否已存在
-                try:
-                    sub_remote_folder = remote_folder[item.name]
-                    print(f"  ⚠ 子文件夹 '{item.name}' 已存在，继续上传内容...")
-                    
-                    # 验证文件夹是否真的可用（通过尝试列出内容）
+                with _api_lock:
+                    # 首先检查文件夹是否已存在
                     try:
-                        list(sub_remote_folder.dir())
+                        sub_remote_folder = remote_folder[item.name]
+                        print(f"  ⚠ 子文件夹 '{item.name}' 已存在，继续上传内容...")
+
+                        # 验证文件夹是否真的可用（通过尝试列出内容）
+                        try:
+                            list(sub_remote_folder.dir())
+                        except:
+                            print(f"  ⚠ 文件夹 '{item.name}' 存在但不可访问，将尝试重新创建")
+                            sub_remote_folder = None
+
                     except:
-                        print(f"  ⚠ 文件夹 '{item.name}' 存在但不可访问，将尝试重新创建")
+                        # 文件夹不存在，尝试创建
                         sub_remote_folder = None
-                        
-                except:
-                    # 文件夹不存在，尝试创建
-                    sub_remote_folder = None
                     
-                    # 使用改进的文件夹创建策略
-                    sub_remote_folder = _create_and_access_folder(remote_folder, item.name, api)
+                        # 使用改进的文件夹创建策略
+                        sub_remote_folder = _create_and_access_folder(remote_folder, item.name, api)
                     
-                    if sub_remote_folder is None:
-                        print(f"  ✗ 无法创建或访问子文件夹: {item.name}")
-                        # 作为备用策略，尝试直接上传文件到当前文件夹
-                        print(f"  🔄 备用策略：将子文件夹内容上传到当前位置")
-                        for sub_item in item.iterdir():
-                            if sub_item.is_file():
-                                backup_relative_path = f"{item.name}_{sub_item.name}"
-                                if _upload_single_file(remote_folder, sub_item, backup_relative_path, conflict_mode):
-                                    success_count += 1
-                                    print(f"  ✓ 备用上传成功: {backup_relative_path}")
-                                else:
-                                    error_count += 1
-                        continue
+                        if sub_remote_folder is None:
+                            print(f"  ✗ 无法创建或访问子文件夹: {item.name}")
+                            # 作为备用策略，尝试直接上传文件到当前文件夹
+                            print(f"  🔄 备用策略：将子文件夹内容上传到当前位置")
+                            for sub_item in item.iterdir():
+                                if sub_item.is_file():
+                                    backup_relative_path = f"{item.name}_{sub_item.name}"
+                                    if _upload_single_file(remote_folder, sub_item, backup_relative_path, conflict_mode, uploaded_files):
+                                        success_count += 1
+                                        print(f"  ✓ 备用上传成功: {backup_relative_path}")
+                                    else:
+                                        error_count += 1
+                            continue
 
                 # 如果成功获取到子文件夹，递归上传内容
                 if sub_remote_folder is not None:
                     try:
-                        sub_success, sub_error = _upload_folder_contents(sub_remote_folder, item, item_relative_path, conflict_mode, api)
+                        sub_success, sub_error = _upload_folder_contents(sub_remote_folder, item, item_relative_path, conflict_mode, api, verifier)
                         success_count += sub_success
                         error_count += sub_error
                     except Exception as e:
@@ -266,6 +301,9 @@ def _upload_folder_contents(remote_folder, local_folder_path, relative_path, con
                     print(f"  ✗ 无法访问子文件夹: {item.name}")
                     error_count += 1
 
+        if verifier and uploaded_files:
+            verifier.submit(remote_folder, uploaded_files)
+
         return success_count, error_count
 
     except Exception as e:
@@ -273,8 +311,13 @@ def _upload_folder_contents(remote_folder, local_folder_path, relative_path, con
         return 0, 1
 
 
-def _upload_single_file(remote_folder, file_path, relative_path, conflict_mode='ask'):
-    """上传单个文件"""
+def _upload_single_file(remote_folder, file_path, relative_path, conflict_mode='ask', uploaded_files=None):
+    """
+    上传单个文件
+
+    如果传入 uploaded_files 列表，实际上传（非跳过）的文件会以
+    (文件路径, 相对路径, 文件大小) 的形式追加到其中，供后台校验使用。
+    """
     try:
         file_size = file_path.stat().st_size
         file_size_mb = file_size / (1024 * 1024)
@@ -351,8 +394,10 @@ def _upload_single_file(remote_folder, file_path, relative_path, conflict_mode='
             # 明确指定文件名进行上传
             remote_folder.upload(file_in, filename=filename)
 
-        # 上传完成 (不进行立即验证，因为iCloud Drive API需要同步时间)
+        # 上传完成 (不进行立即验证，因为iCloud Drive API需要同步时间，由后台校验延迟核对)
         print(f"  ✓ 上传成功: {relative_path}")
+        if uploaded_files is not None:
+            uploaded_files.append((file_path, relative_path, file_size))
         return True
 
     except Exception as e:
@@ -360,6 +405,192 @@ def _upload_single_file(remote_folder, file_path, relative_path, conflict_mode='
         return False
 
 
+class UploadVerifier:
+    """
+    后台上传校验器
+
+    上传线程在每个文件夹处理完成后提交一批已上传文件，校验线程在自适应延迟后
+    重新列出该文件夹一次，批量核对文件名和大小。不一致的文件放入重传队列，
+    由上传线程在主体上传结束后重新上传并再次提交校验。上传过程不会等待校验。
+
+    延迟策略：iCloud Drive 上传后需要同步时间才能在列表中看到文件。
+    校验发现不一致或列出失败时延迟加倍，全部通过时逐步缩短，在 [MIN_DELAY, MAX_DELAY] 之间调整。
+    不一致的文件先按加倍后的延迟再列出一次，仍不一致才重传，避免同步较慢的文件被重复上传
+    （iCloud 会把重复上传保留为冲突副本）。
+    列出文件夹失败只表示"尚未校验"，该批次会在延迟后重新校验，不会触发重传；
+    多次失败后计为未校验。
+    """
+
+    INITIAL_DELAY = 10
+    MIN_DELAY = 3
+    MAX_DELAY = 120
+    MAX_ATTEMPTS = 3  # 每个文件最多上传次数（含首次上传）
+    MAX_LIST_FAILURES = 3  # 每个批次最多列出失败次数，超过后计为未校验
+
+    def __init__(self):
+        self.delay = self.INITIAL_DELAY
+        self._jobs = queue.Queue()
+        self._retries = queue.Queue()
+        self._pending = 0  # 已提交但尚未校验完成的批次数
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._failed = 0
+        self._unverified = 0
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, remote_folder, uploaded_files):
+        """提交一个文件夹中已上传的文件，立即返回"""
+        self._enqueue(remote_folder, list(uploaded_files), 1, 0, False)
+
+    def _enqueue(self, remote_folder, files, attempt, list_failures, rechecked):
+        """新增一个待校验批次；rechecked 表示本次校验不一致时无需再复查，直接重传"""
+        with self._lock:
+            self._pending += 1
+        self._jobs.put((time.monotonic(), remote_folder, files, attempt, list_failures, rechecked))
+
+    def finish(self):
+        """
+        处理重传队列直到所有校验完成，返回 (校验失败文件数, 未能校验文件数)
+
+        在主体上传结束后调用；此时上传线程空闲，负责重新上传校验不一致的文件。
+        """
+        if self._pending:
+            print(f"\n🔍 等待后台校验完成...")
+
+        while True:
+            with self._lock:
+                if self._pending == 0 and self._retries.empty():
+                    break
+            try:
+                remote_folder, files, attempt, list_failures = self._retries.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with _api_lock:
+                self._retry_batch(remote_folder, files, attempt, list_failures)
+            # 先提交新批次再完成本批，避免 _pending 短暂归零导致提前退出
+            with self._lock:
+                self._pending -= 1
+
+        self._jobs.put(None)
+        self._thread.join()
+        return self._failed, self._unverified
+
+    def _retry_batch(self, remote_folder, files, attempt, list_failures):
+        """重新上传一批两次校验都不一致的文件，重传前刷新列表并跳过已同步的文件"""
+        # 刷新列表，overwrite 模式才能基于最新状态判断是否需要删除远程文件
+        try:
+            remote_files = _list_remote_files(remote_folder)
+        except Exception as e:
+            print(f"  ⚠ 重传前列出文件夹失败，稍后重新校验: {e}")
+            # 本次没有重传，退回到重传前的次数，并累计列出失败次数
+            if list_failures + 1 < self.MAX_LIST_FAILURES:
+                self._enqueue(remote_folder, files, attempt - 1, list_failures + 1, True)
+            else:
+                self._mark_unverified(files)
+            return
+
+        reuploaded = []
+        for file_path, relative_path, file_size in files:
+            if _remote_file_matches(remote_files, file_path.name, file_size):
+                print(f"  ✓ 文件已同步，无需重传: {relative_path}")
+                continue
+            print(f"  🔄 重新上传 ({attempt}/{self.MAX_ATTEMPTS}): {relative_path}")
+            if not _upload_single_file(remote_folder, file_path, relative_path, 'overwrite', reuploaded):
+                with self._lock:
+                    self._failed += 1
+        if reuploaded:
+            self._enqueue(remote_folder, reuploaded, attempt, 0, False)
+
+    def _mark_unverified(self, files):
+        for _, relative_path, _ in files:
+            print(f"  ⚠ 多次列出文件夹失败，未能校验: {relative_path}")
+        with self._lock:
+            self._unverified += len(files)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+
+            finished_at, remote_folder, files, attempt, list_failures, rechecked = job
+            wait_time = finished_at + self.delay - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            mismatched = self._check(remote_folder, files)
+            if mismatched is None or mismatched:
+                self.delay = min(self.MAX_DELAY, self.delay * 2)
+            else:
+                self.delay = max(self.MIN_DELAY, self.delay * 0.75)
+
+            if mismatched is None:
+                if list_failures + 1 < self.MAX_LIST_FAILURES:
+                    # 列出失败不代表文件有误，延迟后重新校验
+                    self._jobs.put((time.monotonic(), remote_folder, files, attempt, list_failures + 1, rechecked))
+                    continue
+                self._mark_unverified(files)
+                with self._lock:
+                    self._pending -= 1
+                continue
+
+            if mismatched and not rechecked:
+                # 可能只是同步较慢：按加倍后的延迟再列出一次，仍不一致才重传
+                self._jobs.put((time.monotonic(), remote_folder, mismatched, attempt, list_failures, True))
+                continue
+
+            if mismatched and attempt < self.MAX_ATTEMPTS:
+                # 交给上传线程重传，重传完成后由其减少 _pending
+                self._retries.put((remote_folder, mismatched, attempt + 1, list_failures))
+                continue
+
+            if mismatched:
+                for _, relative_path, _ in mismatched:
+                    print(f"  ✗ 校验失败，已达最大重试次数: {relative_path}")
+            with self._lock:
+                self._failed += len(mismatched)
+                self._pending -= 1
+
+    def _check(self, remote_folder, files):
+        """重新列出远程文件夹一次，返回名称或大小不一致的文件；列出失败时返回 None"""
+        try:
+            with _api_lock:
+                remote_files = _list_remote_files(remote_folder)
+        except Exception as e:
+            print(f"  ⚠ 校验时列出文件夹失败: {e}")
+            return None
+
+        mismatched = []
+        for file_path, relative_path, file_size in files:
+            if file_path.name not in remote_files:
+                print(f"  ⚠ 校验未找到文件: {relative_path}")
+                mismatched.append((file_path, relative_path, file_size))
+            elif not _remote_file_matches(remote_files, file_path.name, file_size):
+                print(f"  ⚠ 校验大小不一致: {relative_path} (本地 {file_size}, 远程 {remote_files[file_path.name]})")
+                mismatched.append((file_path, relative_path, file_size))
+        return mismatched
+
+
+def _list_remote_files(remote_folder):
+    """强制从服务器重新获取远程文件夹列表，返回 {文件名: 大小}"""
+    return {
+        child.name: child.size
+        for child in remote_folder.get_children(force=True)
+        if child.type == 'file'
+    }
+
+
+def _remote_file_matches(remote_files, filename, file_size):
+    """远程列表中存在同名文件且大小一致（远程大小未知时只核对文件名）"""
+    if filename not in remote_files:
+        return False
+    remote_size = remote_files[filename]
+    return remote_size is None or remote_size == file_size
+
+
 def list_local_folder_contents(folder_path):
     """列出本地文件夹内容"""
     path = Path(folder_path)
@@ -394,6 +625,7 @@ def main():
     local_folder = os.getenv('LOCAL_FOLDER_PATH')
     remote_name = os.getenv('REMOTE_FOLDER_NAME')
     conflict_mode = os.getenv('CONFLICT_MODE', 'skip')  # 默认跳过已存在文件
+    verify = os.getenv('VERIFY_UPLOADS', 'true').strip().lower() not in ('false', '0', 'no')
 
     # 验证必需的配置
     if not apple_id or not apple_password:
@@ -417,6 +649,7 @@ def main():
     print(f"  本地文件夹: {local_folder}")
     print(f"  远程文件夹名: {remote_name or '使用本地文件夹名'}")
     print(f"  冲突处理模式: {conflict_mode}")
+    print(f"  上传后校验: {'开启' if verify else '关闭'}")
 
     try:
         # 登录iCloud
@@ -452,7 +685,7 @@ def main():
 
         # 开始上传
         print(f"\n开始自动上传 '{local_folder}' 到iCloud Drive...")
-        success = upload_folder_to_icloud(api, local_folder, remote_name, conflict_mode)
+        success = upload_folder_to_icloud(api, local_folder, remote_name, conflict_mode, verify)
 
         if success:
             print(f"\n🎉 文件夹上传完成！")
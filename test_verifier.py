@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+测试脚本 - 离线验证上传后台校验逻辑
+
+使用 pyicloud 真实的 DriveNode 和一个伪造的连接对象，无需 Apple ID。
+
+使用方法：
+    uv run --with pytest python -m pytest test_verifier.py
+"""
+
+import sys
+import os
+import time
+
+import pytest
+from pyicloud.services.drive import DriveNode
+
+# 添加当前目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+
+class FakeDriveConnection:
+    """
+    模拟 iCloud Drive 服务端：保存上传的文件
+
+    可以按文件名丢弃上传、让文件在若干次列表请求后或若干秒后才出现（模拟同步延迟），
+    或让指定序号的列表请求失败。列表请求只从第一次上传之后开始计数，即校验阶段的请求。
+    """
+
+    def __init__(self, drop_uploads=None, sync_delays=None, sync_seconds=None, fail_listings=()):
+        self.items = {}  # drivewsid -> 子节点数据列表
+        self.upload_counts = {}
+        self.drop_uploads = dict(drop_uploads or {})  # 文件名 -> 丢弃次数
+        self.sync_delays = dict(sync_delays or {})  # 文件名 -> 上传后对多少次成功的列表请求不可见
+        self.sync_seconds = dict(sync_seconds or {})  # 文件名 -> 上传后多少秒不可见
+        self.fail_listings = set(fail_listings)  # 失败的列表请求序号（从 1 开始）
+        self.listings = 0
+        self.hidden = {}  # 文件名 -> 剩余不可见次数
+        self.visible_at = {}  # 文件名 -> 可见时间
+
+    def root(self):
+        self.items["FOLDER::root"] = []
+        return DriveNode(self, {"drivewsid": "FOLDER::root", "docwsid": "root",
+                                "zone": "test", "name": "dst", "type": "FOLDER"})
+
+    def get_node_data(self, drivewsid):
+        if self.upload_counts:
+            self.listings += 1
+            if self.listings in self.fail_listings:
+                raise ConnectionError("temporary listing error")
+
+        items = []
+        for item in self.items[drivewsid]:
+            if time.monotonic() < self.visible_at.get(item["name"], 0):
+                continue
+            if self.hidden.get(item["name"]):
+                self.hidden[item["name"]] -= 1
+                continue
+            items.append(dict(item))
+        return {"items": items}
+
+    def send_file(self, docwsid, file_object, zone=None, filename=None):
+        data = file_object.read()
+        self.upload_counts[filename] = self.upload_counts.get(filename, 0) + 1
+        if self.drop_uploads.get(filename):
+            self.drop_uploads[filename] -= 1
+            return
+        self.hidden[filename] = self.sync_delays.pop(filename, 0)
+        self.visible_at[filename] = time.monotonic() + self.sync_seconds.pop(filename, 0)
+        self.items[f"FOLDER::{docwsid}"].append({
+            "drivewsid": f"FILE::{filename}", "docwsid": filename, "zone": zone,
+            "name": filename, "type": "FILE", "size": len(data), "etag": "1",
+        })
+
+    def delete_items(self, drivewsid, etag):
+        for items in self.items.values():
+            items[:] = [item for item in items if item["drivewsid"] != drivewsid]
+
+
+@pytest.fixture(autouse=True)
+def fast_verifier_delays(monkeypatch):
+    """把校验延迟缩短到毫秒级，避免测试等待真实的同步时间"""
+    monkeypatch.setattr(main.UploadVerifier, "INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(main.UploadVerifier, "MIN_DELAY", 0.01)
+
+
+@pytest.fixture
+def local_folder(tmp_path):
+    (tmp_path / "a.txt").write_text("hello")
+    (tmp_path / "b.txt").write_text("world!")
+    return tmp_path
+
+
+def test_all_files_match(local_folder):
+    conn = FakeDriveConnection()
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (2, 0)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 1}
+
+
+def test_missing_file_fixed_on_retry(local_folder):
+    conn = FakeDriveConnection(drop_uploads={"b.txt": 1})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (2, 0)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 2}
+    assert sorted(item["name"] for item in conn.items["FOLDER::root"]) == ["a.txt", "b.txt"]
+
+
+def test_attempts_run_out(local_folder):
+    conn = FakeDriveConnection(drop_uploads={"b.txt": main.UploadVerifier.MAX_ATTEMPTS})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (1, 1)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": main.UploadVerifier.MAX_ATTEMPTS}
+
+
+def test_late_sync_found_on_recheck(local_folder, monkeypatch):
+    # b.txt 上传 0.4 秒后才同步：0.2 秒时的第一次校验看不到，延迟加倍后的复查（约 0.6 秒）能看到
+    monkeypatch.setattr(main.UploadVerifier, "INITIAL_DELAY", 0.2)
+    conn = FakeDriveConnection(sync_seconds={"b.txt": 0.4})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (2, 0)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 1}
+
+
+def test_synced_before_retry_is_skipped(local_folder, capsys):
+    # b.txt 在校验和复查时都不可见，重传前刷新列表时出现
+    conn = FakeDriveConnection(sync_delays={"b.txt": 2})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (2, 0)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 1}
+    assert "文件已同步，无需重传: b.txt" in capsys.readouterr().out
+
+
+def test_listing_failure_does_not_reupload(local_folder):
+    conn = FakeDriveConnection(fail_listings={1})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (2, 0)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 1}
+
+
+def test_listing_failures_exhausted_are_unverified(local_folder):
+    conn = FakeDriveConnection(fail_listings=range(1, main.UploadVerifier.MAX_LIST_FAILURES + 1))
+    verifier = main.UploadVerifier()
+    verifier.start()
+
+    main._upload_folder_contents(conn.root(), local_folder, "", 'skip', None, verifier)
+
+    assert verifier.finish() == (0, 2)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": 1}
+
+
+def test_failed_refresh_before_retry_keeps_attempts(local_folder):
+    # 列表请求顺序：1 校验、2 复查、3 重传前刷新（失败），之后的重传仍可用满 MAX_ATTEMPTS 次上传
+    conn = FakeDriveConnection(drop_uploads={"b.txt": main.UploadVerifier.MAX_ATTEMPTS}, fail_listings={3})
+
+    result = main._upload_and_verify(conn.root(), local_folder, 'skip', None, True)
+
+    assert result == (1, 1)
+    assert conn.upload_counts == {"a.txt": 1, "b.txt": main.UploadVerifier.MAX_ATTEMPTS}